@@ -1,33 +1,185 @@
 from __future__ import annotations
 
 import os
+import queue
+import re
 import sqlite3
-import math
+import threading
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
 from datetime import date, datetime, timedelta
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlencode
 
+import anyio
 import bcrypt
+import jinja2
 from fastapi import Depends, FastAPI, Form, HTTPException, Request, Response
-from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, ORJSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
+from starlette.concurrency import run_in_threadpool
 from starlette.middleware.sessions import SessionMiddleware
 
 APP_DIR = os.path.dirname(os.path.abspath(__file__))
 DB_PATH = os.path.join(APP_DIR, "btech_buddy.sqlite3")
+DB_POOL_SIZE = int(os.getenv("BTB_DB_POOL_SIZE", "8"))
+DB_STATEMENT_CACHE = 256
+TEMPLATES_AUTO_RELOAD = os.getenv("BTB_TEMPLATES_AUTO_RELOAD", "0") == "1"
+STATIC_MAX_AGE = int(os.getenv("BTB_STATIC_MAX_AGE", "86400"))
+# bcrypt cost is 2**rounds. 10 (OWASP's minimum) hashes about 4x faster than the
+# library default of 12 and keeps register/login well under interactive latency.
+# Raise it on faster hardware. Existing hashes keep their own cost and still verify.
+BCRYPT_ROUNDS = int(os.getenv("BTB_BCRYPT_ROUNDS", "10"))
 
 # ---------- Database helpers ----------
 
+# Queries shared by several pages. Keeping one copy of each means every page
+# hits the same entry in the per-connection statement cache.
+SQL_SUBJECT_OPTIONS = "SELECT id, name, code FROM subjects WHERE user_id = ? ORDER BY name"
+
+SQL_DAY_ENTRIES = """
+    SELECT t.id, t.start_time, t.end_time, t.location, s.name AS subject_name, s.code AS subject_code
+    FROM timetable_entries t
+    JOIN subjects s ON s.id = t.subject_id
+    WHERE t.user_id = ? AND t.day_of_week = ?
+    ORDER BY t.start_time
+"""
+
+CONN_PRAGMAS = """
+    PRAGMA foreign_keys = ON;
+    PRAGMA synchronous = NORMAL;
+    PRAGMA temp_store = MEMORY;
+    PRAGMA mmap_size = 268435456;
+    PRAGMA cache_size = -64000;
+    PRAGMA busy_timeout = 5000;
+"""
+
 def get_conn() -> sqlite3.Connection:
-    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False, cached_statements=DB_STATEMENT_CACHE)
     conn.row_factory = sqlite3.Row
-    conn.execute("PRAGMA foreign_keys = ON;")
+    # Per-connection settings in one script; WAL itself is persisted in the DB file by init_db()
+    conn.executescript(CONN_PRAGMAS)
     return conn
 
+# Connections are opened once at startup and reused across requests, so the
+# file open and SQLite's page cache are not thrown away on every request.
+_pool: "queue.Queue[sqlite3.Connection]" = queue.Queue()
+# Requests wait for a free connection here, on the event loop. A worker thread
+# parked on the queue could starve the handlers holding connections of a thread
+# to finish on, and then nothing would ever be returned to the pool.
+_pool_slots: Optional[anyio.Semaphore] = None
+
+def open_pool(size: int = DB_POOL_SIZE) -> None:
+    global _pool_slots
+    for _ in range(size):
+        _pool.put(get_conn())
+    _pool_slots = anyio.Semaphore(size)
+
+def close_pool() -> None:
+    while True:
+        try:
+            _pool.get_nowait().close()
+        except queue.Empty:
+            break
+
+@asynccontextmanager
+async def pooled_conn() -> AsyncIterator[sqlite3.Connection]:
+    async with _pool_slots:
+        conn = _pool.get_nowait()
+        try:
+            yield conn
+        finally:
+            # Never hand a half-finished transaction to the next request
+            conn.rollback()
+            _pool.put_nowait(conn)
+
+def dict_factory(cursor: sqlite3.Cursor, row: Tuple[Any, ...]) -> Dict[str, Any]:
+    return {col[0]: value for col, value in zip(cursor.description, row)}
+
+def dict_cursor(conn: sqlite3.Connection) -> sqlite3.Cursor:
+    # Rows come back as plain dicts, ready for JSON encoding without a dict(r) pass
+    cur = conn.cursor()
+    cur.row_factory = dict_factory
+    return cur
+
+@contextmanager
+def read_snapshot(conn: sqlite3.Connection) -> Iterator[sqlite3.Connection]:
+    # Group several SELECTs under one BEGIN so they share a single WAL snapshot
+    conn.execute("BEGIN")
+    try:
+        yield conn
+    finally:
+        conn.commit()
+
+# One fixed statement per /tasks tab, so each tab's query stays in the statement cache
+SQL_TASKS_PAGE = """
+    SELECT tasks.id, tasks.title, tasks.due_at, tasks.priority, tasks.status, tasks.subject_id,
+           subjects.name AS subject_name, subjects.code AS subject_code
+    FROM tasks
+    LEFT JOIN subjects ON subjects.id = tasks.subject_id
+    WHERE tasks.user_id = ? {status}
+    ORDER BY
+      tasks.status DESC, -- 'todo' before 'done'
+      tasks.priority_rank,
+      tasks.due_at IS NULL,
+      tasks.due_at DESC
+"""
+SQL_TASKS_LIST = {
+    "todo": SQL_TASKS_PAGE.format(status="AND tasks.status = 'todo'"),
+    "done": SQL_TASKS_PAGE.format(status="AND tasks.status = 'done'"),
+    "all": SQL_TASKS_PAGE.format(status=""),
+}
+
+# Resources and coding logs are paged newest-first by (sort column, id). Each page
+# is one index range scan, however long the history gets.
+PAGE_SIZE = 20
+
+SQL_RESOURCES_PAGE = """
+    SELECT r.id, r.title, r.url, r.tags, r.created_at, s.name AS subject_name, s.code AS subject_code
+    FROM resources r
+    LEFT JOIN subjects s ON s.id = r.subject_id
+    WHERE r.user_id = ? {cursor}
+    ORDER BY r.created_at DESC, r.id DESC
+    LIMIT ?
+"""
+SQL_RESOURCES_FIRST = SQL_RESOURCES_PAGE.format(cursor="")
+SQL_RESOURCES_AFTER = SQL_RESOURCES_PAGE.format(cursor="AND (r.created_at, r.id) < (?, ?)")
+
+SQL_CODING_PAGE = """
+    SELECT id, log_date, platform, problem, difficulty, topic, link
+    FROM coding_logs
+    WHERE user_id = ? {cursor}
+    ORDER BY log_date DESC, id DESC
+    LIMIT ?
+"""
+SQL_CODING_FIRST = SQL_CODING_PAGE.format(cursor="")
+SQL_CODING_AFTER = SQL_CODING_PAGE.format(cursor="AND (log_date, id) < (?, ?)")
+
+def keyset_page(rows: List[sqlite3.Row], path: str, sort_col: str) -> Tuple[List[sqlite3.Row], Optional[str]]:
+    # Callers fetch PAGE_SIZE + 1 rows; the extra one only signals that an older page exists
+    if len(rows) <= PAGE_SIZE:
+        return rows, None
+    rows = rows[:PAGE_SIZE]
+    last = rows[-1]
+    return rows, f"{path}?{urlencode({'after': last[sort_col], 'after_id': last['id']})}"
+
 def init_db() -> None:
     conn = get_conn()
     cur = conn.cursor()
 
+    # WAL lets readers run alongside a writer and turns commits into log appends
+    cur.execute("PRAGMA journal_mode = WAL;")
+
+    # Databases created before tasks.priority_rank existed get it added in place.
+    # SQLite can only ALTER in VIRTUAL generated columns, so new tables use VIRTUAL too.
+    task_cols = {row["name"] for row in cur.execute("PRAGMA table_xinfo(tasks)")}
+    if task_cols and "priority_rank" not in task_cols:
+        cur.execute(
+            "ALTER TABLE tasks ADD COLUMN priority_rank INTEGER "
+            "GENERATED ALWAYS AS (CASE priority WHEN 'high' THEN 0 WHEN 'medium' THEN 1 ELSE 2 END) VIRTUAL"
+        )
+
     cur.executescript(
         """
         CREATE TABLE IF NOT EXISTS users (
@@ -84,6 +236,7 @@ def init_db() -> None:
             priority TEXT NOT NULL DEFAULT 'medium' CHECK(priority IN ('low','medium','high')),
             status TEXT NOT NULL DEFAULT 'todo' CHECK(status IN ('todo','done')),
             created_at TEXT NOT NULL,
+            priority_rank INTEGER GENERATED ALWAYS AS (CASE priority WHEN 'high' THEN 0 WHEN 'medium' THEN 1 ELSE 2 END) VIRTUAL,
             FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE,
             FOREIGN KEY(subject_id) REFERENCES subjects(id) ON DELETE SET NULL
         );
@@ -112,16 +265,42 @@ def init_db() -> None:
             created_at TEXT NOT NULL,
             FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE
         );
+
+        -- Bumped in the same transaction as any attendance/subject write; keys the summary cache
+        CREATE TABLE IF NOT EXISTS summary_versions (
+            user_id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL,
+            FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE
+        );
+
+        -- Every page filters by user_id; these keep lookups and ORDER BYs on an index.
+        -- attendance_records(user_id, subject_id, class_date) is already covered by its UNIQUE constraint.
+        CREATE INDEX IF NOT EXISTS idx_att_user_date ON attendance_records(user_id, class_date);
+        CREATE INDEX IF NOT EXISTS idx_tt_user_day ON timetable_entries(user_id, day_of_week, start_time);
+        -- Match the dashboard and task list ORDER BYs exactly so neither needs a sort step
+        DROP INDEX IF EXISTS idx_tasks_user_status_due;
+        CREATE INDEX IF NOT EXISTS idx_tasks_sort ON tasks(user_id, status, priority_rank, due_at IS NULL, due_at);
+        CREATE INDEX IF NOT EXISTS idx_tasks_list ON tasks(user_id, status DESC, priority_rank, due_at IS NULL, due_at DESC);
+        CREATE INDEX IF NOT EXISTS idx_subjects_user_name ON subjects(user_id, name);
+        -- Keyset pagination order for the resources and coding pages (id breaks ties)
+        DROP INDEX IF EXISTS idx_resources_user_created;
+        DROP INDEX IF EXISTS idx_coding_user_date;
+        CREATE INDEX IF NOT EXISTS idx_resources_user_created_id ON resources(user_id, created_at DESC, id DESC);
+        CREATE INDEX IF NOT EXISTS idx_coding_user_date_id ON coding_logs(user_id, log_date DESC, id DESC);
         """
     )
     conn.commit()
     conn.close()
 
+def iso_seconds(dt: datetime) -> str:
+    # Same output as dt.replace(microsecond=0).isoformat() for naive datetimes, in one step
+    return f"{dt.year:04}-{dt.month:02}-{dt.day:02}T{dt.hour:02}:{dt.minute:02}:{dt.second:02}"
+
 def now_iso() -> str:
-    return datetime.now().replace(microsecond=0).isoformat()
+    return iso_seconds(datetime.now())
 
 def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
+    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode("utf-8")
 
 def verify_password(password: str, password_hash: str) -> bool:
     try:
@@ -131,16 +310,46 @@ def verify_password(password: str, password_hash: str) -> bool:
 
 # ---------- Auth helpers ----------
 
-def require_user(request: Request) -> Dict[str, Any]:
-    user_id = request.session.get("user_id")
-    if not user_id:
+EMAIL_RE = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+
+def current_user(request: Request) -> Optional[Dict[str, Any]]:
+    # Built once per request and kept on request.state (shared by every Request
+    # object for the same scope), so repeated helper calls reuse it
+    try:
+        return request.state.user
+    except AttributeError:
+        pass
+    session = request.session
+    user_id = session.get("user_id")
+    user = {"id": int(user_id), "name": session.get("user_name"), "email": session.get("user_email")} if user_id else None
+    request.state.user = user
+    return user
+
+class LoginRequired(Exception):
+    pass
+
+# Auth runs as a dependency of the connection dependencies below, so anonymous
+# requests are turned away before they take a pool slot.
+async def require_user(request: Request) -> Dict[str, Any]:
+    user = current_user(request)
+    if user is None:
         raise HTTPException(status_code=401, detail="Not authenticated")
-    return {"id": int(user_id), "name": request.session.get("user_name"), "email": request.session.get("user_email")}
+    return user
+
+async def page_user(request: Request) -> Dict[str, Any]:
+    # Page handlers: anonymous visitors are sent to /login (see the handler below)
+    user = current_user(request)
+    if user is None:
+        raise LoginRequired()
+    return user
+
+async def db(user: Dict[str, Any] = Depends(require_user)) -> AsyncIterator[sqlite3.Connection]:
+    async with pooled_conn() as conn:
+        yield conn
 
-def redirect_if_not_logged_in(request: Request) -> Optional[RedirectResponse]:
-    if not request.session.get("user_id"):
-        return RedirectResponse(url="/login", status_code=303)
-    return None
+async def page_db(user: Dict[str, Any] = Depends(page_user)) -> AsyncIterator[sqlite3.Connection]:
+    async with pooled_conn() as conn:
+        yield conn
 
 # ---------- App ----------
 
@@ -149,18 +358,49 @@ app = FastAPI(title="BTech Buddy (CSE)")
 SECRET_KEY = os.getenv("BTB_SECRET_KEY", "dev-secret-change-me")
 app.add_middleware(SessionMiddleware, secret_key=SECRET_KEY, same_site="lax")
 
-app.mount("/static", StaticFiles(directory=os.path.join(APP_DIR, "static")), name="static")
-templates = Jinja2Templates(directory=os.path.join(APP_DIR, "templates"))
+@app.exception_handler(LoginRequired)
+async def _login_required(request: Request, exc: LoginRequired) -> RedirectResponse:
+    return RedirectResponse(url="/login", status_code=303)
+
+class CachedStaticFiles(StaticFiles):
+    # StaticFiles already sends ETag/Last-Modified and answers 304s; adding
+    # Cache-Control lets browsers skip the round-trip entirely until max-age runs out.
+    def file_response(self, *args: Any, **kwargs: Any) -> Response:
+        response = super().file_response(*args, **kwargs)
+        response.headers["Cache-Control"] = f"public, max-age={STATIC_MAX_AGE}"
+        return response
+
+app.mount("/static", CachedStaticFiles(directory=os.path.join(APP_DIR, "static")), name="static")
+# One shared environment with an unbounded cache: compiled templates live for the
+# whole process, and mtime checks are skipped unless auto-reload is switched on.
+templates = Jinja2Templates(
+    env=jinja2.Environment(
+        loader=jinja2.FileSystemLoader(os.path.join(APP_DIR, "templates")),
+        autoescape=True,
+        auto_reload=TEMPLATES_AUTO_RELOAD,
+        cache_size=-1,
+    )
+)
+
+def warm_templates() -> None:
+    for name in templates.env.list_templates(extensions=["html"]):
+        templates.env.get_template(name)
 
 @app.on_event("startup")
 def _startup() -> None:
     init_db()
+    open_pool()
+    warm_templates()
+
+@app.on_event("shutdown")
+def _shutdown() -> None:
+    close_pool()
 
 # ---------- Common UI routes ----------
 
 @app.get("/", response_class=HTMLResponse)
 def home(request: Request):
-    if request.session.get("user_id"):
+    if current_user(request):
         return RedirectResponse(url="/dashboard", status_code=303)
     return RedirectResponse(url="/login", status_code=303)
 
@@ -168,36 +408,53 @@ def home(request: Request):
 def register_form(request: Request):
     return templates.TemplateResponse("register.html", {"request": request})
 
+# register/login borrow a pooled connection only around their SQL, so the slow
+# bcrypt work does not pin one of the pool slots. They are async so the borrow
+# waits on the event loop like db(); bcrypt and the SQL run in the threadpool.
+def _insert_user(conn: sqlite3.Connection, name: str, email: str, password_hash: str) -> None:
+    with conn:
+        conn.execute(
+            "INSERT INTO users (name, email, password_hash, created_at) VALUES (?, ?, ?, ?)",
+            (name, email, password_hash, now_iso()),
+        )
+
+def _find_user(conn: sqlite3.Connection, email: str) -> Optional[sqlite3.Row]:
+    return conn.execute("SELECT id, name, email, password_hash FROM users WHERE email = ?", (email,)).fetchone()
+
 @app.post("/register")
-def register(
+async def register(
     request: Request,
     name: str = Form(...),
     email: str = Form(...),
     password: str = Form(...),
 ):
+    # Reject bad input before paying for bcrypt or a pooled connection
+    name = name.strip()
     email = email.strip().lower()
-    if len(password) < 6:
+    error = None
+    if not name:
+        error = "Please enter your name."
+    elif not EMAIL_RE.match(email):
+        error = "Please enter a valid email address."
+    elif len(password) < 6:
+        error = "Password must be at least 6 characters."
+    if error:
         return templates.TemplateResponse(
             "register.html",
-            {"request": request, "error": "Password must be at least 6 characters."},
+            {"request": request, "error": error},
             status_code=400,
         )
 
-    conn = get_conn()
+    password_hash = await run_in_threadpool(hash_password, password)
     try:
-        conn.execute(
-            "INSERT INTO users (name, email, password_hash, created_at) VALUES (?, ?, ?, ?)",
-            (name.strip(), email, hash_password(password), now_iso()),
-        )
-        conn.commit()
+        async with pooled_conn() as conn:
+            await run_in_threadpool(_insert_user, conn, name, email, password_hash)
     except sqlite3.IntegrityError:
         return templates.TemplateResponse(
             "register.html",
             {"request": request, "error": "Email already registered. Try logging in."},
             status_code=400,
         )
-    finally:
-        conn.close()
 
     return RedirectResponse(url="/login", status_code=303)
 
@@ -206,17 +463,16 @@ def login_form(request: Request):
     return templates.TemplateResponse("login.html", {"request": request})
 
 @app.post("/login")
-def login(
+async def login(
     request: Request,
     email: str = Form(...),
     password: str = Form(...),
 ):
     email = email.strip().lower()
-    conn = get_conn()
-    user = conn.execute("SELECT * FROM users WHERE email = ?", (email,)).fetchone()
-    conn.close()
+    async with pooled_conn() as conn:
+        user = await run_in_threadpool(_find_user, conn, email)
 
-    if not user or not verify_password(password, user["password_hash"]):
+    if not user or not await run_in_threadpool(verify_password, password, user["password_hash"]):
         return templates.TemplateResponse(
             "login.html",
             {"request": request, "error": "Invalid email or password."},
@@ -233,109 +489,138 @@ def logout(request: Request):
     request.session.clear()
     return RedirectResponse(url="/login", status_code=303)
 
-# ---------- Dashboard ----------
+# ---------- Attendance summary ----------
 
-def _weekday_idx(d: date) -> int:
-    # Monday=0..Sunday=6
-    return (d.weekday())
-
-@app.get("/dashboard", response_class=HTMLResponse)
-def dashboard(request: Request):
-    redir = redirect_if_not_logged_in(request)
-    if redir:
-        return redir
-
-    user = require_user(request)
-    today = date.today()
-    dow = _weekday_idx(today)
-
-    conn = get_conn()
+# The per-subject summary is shown on both the dashboard and the attendance page
+# and only changes when attendance or subjects change, so it is cached per user.
+# Writes bump the user's row in summary_versions inside their own transaction,
+# which makes old entries unreachable; the LRU bound drops them eventually.
+_summary_cache: "OrderedDict[Tuple[int, int], List[Dict[str, Any]]]" = OrderedDict()
+_summary_lock = threading.Lock()
+SUMMARY_CACHE_SIZE = 1024
 
-    # Today's classes
-    classes = conn.execute(
-        """
-        SELECT t.*, s.name AS subject_name, s.code AS subject_code
-        FROM timetable_entries t
-        JOIN subjects s ON s.id = t.subject_id
-        WHERE t.user_id = ? AND t.day_of_week = ?
-        ORDER BY t.start_time
-        """,
-        (user["id"], dow),
-    ).fetchall()
-
-    # Upcoming tasks in next 7 days
-    horizon = (datetime.now() + timedelta(days=7)).replace(microsecond=0).isoformat()
-    tasks = conn.execute(
+def bump_attendance_version(conn: sqlite3.Connection, user_id: int) -> None:
+    # Call inside the write's `with conn:` so the bump commits with the data
+    conn.execute(
         """
-        SELECT tasks.*, subjects.name AS subject_name
-        FROM tasks
-        LEFT JOIN subjects ON subjects.id = tasks.subject_id
-        WHERE tasks.user_id = ?
-          AND tasks.status = 'todo'
-          AND (tasks.due_at IS NULL OR tasks.due_at <= ?)
-        ORDER BY
-          CASE tasks.priority WHEN 'high' THEN 0 WHEN 'medium' THEN 1 ELSE 2 END,
-          tasks.due_at IS NULL,
-          tasks.due_at
-        LIMIT 10
+        INSERT INTO summary_versions (user_id, version) VALUES (?, 1)
+        ON CONFLICT(user_id) DO UPDATE SET version = version + 1
         """,
-        (user["id"], horizon),
-    ).fetchall()
+        (user_id,),
+    )
 
-    # Attendance summary per subject
-    attendance = conn.execute(
+def _compute_attendance_summary(conn: sqlite3.Connection, user_id: int) -> List[Dict[str, Any]]:
+    # safe_absences: how many more classes you can miss and still stay >= target
+    # need_attend: if below target, how many consecutive "present" you need to reach it (ceil)
+    rows = conn.execute(
         """
+        WITH agg AS (
+            SELECT
+                s.id AS subject_id,
+                COALESCE(s.code, '') AS subject_code,
+                s.name AS subject_name,
+                COUNT(a.id) AS total_classes,
+                COALESCE(SUM(CASE WHEN a.status='present' THEN 1 ELSE 0 END), 0) AS present_classes,
+                COALESCE(NULLIF(s.target_attendance, 0), 75.0) AS target_attendance
+            FROM subjects s
+            LEFT JOIN attendance_records a
+                ON a.subject_id = s.id AND a.user_id = s.user_id
+            WHERE s.user_id = ?
+            GROUP BY s.id
+        ),
+        calc AS (
+            SELECT
+                agg.*,
+                CASE WHEN total_classes > 0
+                     THEN ROUND((present_classes * 1.0 / total_classes) * 100.0, 1)
+                     ELSE 0.0 END AS percentage,
+                target_attendance / 100.0 AS target,
+                total_classes > 0 AND target_attendance / 100.0 > 0.0 AND target_attendance / 100.0 < 1.0 AS in_range,
+                (target_attendance / 100.0 * total_classes - present_classes) / (1.0 - target_attendance / 100.0) AS need_raw
+            FROM agg
+        )
         SELECT
-            s.id AS subject_id,
-            COALESCE(s.code, '') AS subject_code,
-            s.name AS subject_name,
-            COUNT(a.id) AS total_classes,
-            SUM(CASE WHEN a.status='present' THEN 1 ELSE 0 END) AS present_classes,
-            s.target_attendance AS target_attendance
-        FROM subjects s
-        LEFT JOIN attendance_records a
-            ON a.subject_id = s.id AND a.user_id = s.user_id
-        WHERE s.user_id = ?
-        GROUP BY s.id
-        ORDER BY s.name
+            subject_id,
+            subject_code,
+            subject_name,
+            total_classes,
+            present_classes,
+            percentage,
+            target_attendance,
+            CASE WHEN in_range
+                 THEN MAX(0, CAST(present_classes / target - total_classes AS INTEGER))
+                 ELSE 0 END AS safe_absences,
+            CASE WHEN in_range AND percentage < target_attendance
+                 THEN CAST(need_raw AS INTEGER) + (need_raw > CAST(need_raw AS INTEGER))
+                 ELSE 0 END AS need_attend
+        FROM calc
+        ORDER BY subject_name
         """,
-        (user["id"],),
+        (user_id,),
     ).fetchall()
+    return [dict(r) for r in rows]
 
-    conn.close()
+def attendance_summary(conn: sqlite3.Connection, user_id: int) -> List[Dict[str, Any]]:
+    # Inside read_snapshot() the version and the summary come from the same snapshot.
+    # Outside one, reading the version first means a concurrent write can only make
+    # the stored entry newer than its key, never older.
+    row = conn.execute("SELECT version FROM summary_versions WHERE user_id = ?", (user_id,)).fetchone()
+    key = (user_id, row[0] if row else 0)
+    with _summary_lock:
+        cached = _summary_cache.get(key)
+        if cached is not None:
+            _summary_cache.move_to_end(key)
+            return cached
+
+    summary = _compute_attendance_summary(conn, user_id)
+    with _summary_lock:
+        _summary_cache[key] = summary
+        if len(_summary_cache) > SUMMARY_CACHE_SIZE:
+            _summary_cache.popitem(last=False)
+    return summary
+
+# ---------- Dashboard ----------
 
-    def pct(present: int, total: int) -> float:
-        return round((present / total) * 100.0, 1) if total else 0.0
-
-    attendance_rows = []
-    for row in attendance:
-        total = int(row["total_classes"])
-        present = int(row["present_classes"] or 0)
-        target_pct = float(row["target_attendance"] or 75.0)
-        target = (target_pct / 100.0) if target_pct else 0.0
-
-        percentage = pct(present, total)
-
-        safe_absences = 0
-        need_attend = 0
-        if total > 0 and 0.0 < target < 1.0:
-            # How many more classes you can miss and still stay >= target
-            safe_absences = max(0, int((present / target) - total))
-            # If below target, how many consecutive "present" you need to reach it
-            if percentage < target_pct:
-                need_attend = int(math.ceil((target * total - present) / (1.0 - target)))
-
-        attendance_rows.append({
-            "subject_id": row["subject_id"],
-            "subject_code": row["subject_code"],
-            "subject_name": row["subject_name"],
-            "total_classes": total,
-            "present_classes": present,
-            "percentage": percentage,
-            "target_attendance": target_pct,
-            "safe_absences": safe_absences,
-            "need_attend": need_attend,
-        })
+# Indexed by date.weekday(); built once instead of via strftime() per request
+WEEKDAY_NAMES = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")
+DAY_LABELS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+DAY_CHOICES = list(enumerate(DAY_LABELS))
+
+def _weekday_idx(d: date) -> int:
+    # Monday=0..Sunday=6
+    return (d.weekday())
+
+@app.get("/dashboard", response_class=HTMLResponse)
+def dashboard(request: Request, user: Dict[str, Any] = Depends(page_user), conn: sqlite3.Connection = Depends(page_db)):
+
+    today = date.today()
+    dow = _weekday_idx(today)
+    horizon = iso_seconds(datetime.now() + timedelta(days=7))
+
+    # One read transaction: classes, tasks and attendance see the same snapshot
+    with read_snapshot(conn):
+        # Today's classes
+        classes = conn.execute(SQL_DAY_ENTRIES, (user["id"], dow)).fetchall()
+
+        # Upcoming tasks in next 7 days
+        tasks = conn.execute(
+            """
+            SELECT tasks.id, tasks.title, tasks.due_at, tasks.priority, subjects.name AS subject_name
+            FROM tasks
+            LEFT JOIN subjects ON subjects.id = tasks.subject_id
+            WHERE tasks.user_id = ?
+              AND tasks.status = 'todo'
+              AND (tasks.due_at IS NULL OR tasks.due_at <= ?)
+            ORDER BY
+              tasks.priority_rank,
+              tasks.due_at IS NULL,
+              tasks.due_at
+            LIMIT 10
+            """,
+            (user["id"], horizon),
+        ).fetchall()
+
+        attendance_rows = attendance_summary(conn, user["id"])
 
     return templates.TemplateResponse(
         "dashboard.html",
@@ -343,7 +628,7 @@ def dashboard(request: Request):
             "request": request,
             "user": user,
             "today": today.isoformat(),
-            "weekday": today.strftime("%A"),
+            "weekday": WEEKDAY_NAMES[dow],
             "classes": classes,
             "tasks": tasks,
             "attendance": attendance_rows,
@@ -353,17 +638,11 @@ def dashboard(request: Request):
 # ---------- Subjects ----------
 
 @app.get("/subjects", response_class=HTMLResponse)
-def subjects_page(request: Request):
-    redir = redirect_if_not_logged_in(request)
-    if redir:
-        return redir
-    user = require_user(request)
-    conn = get_conn()
+def subjects_page(request: Request, user: Dict[str, Any] = Depends(page_user), conn: sqlite3.Connection = Depends(page_db)):
     subjects = conn.execute(
-        "SELECT * FROM subjects WHERE user_id = ? ORDER BY name",
+        "SELECT id, code, name, credits, target_attendance FROM subjects WHERE user_id = ? ORDER BY name",
         (user["id"],),
     ).fetchall()
-    conn.close()
     return templates.TemplateResponse("subjects.html", {"request": request, "user": user, "subjects": subjects})
 
 @app.post("/subjects/add")
@@ -373,62 +652,44 @@ def subjects_add(
     code: str = Form(""),
     credits: int = Form(0),
     target_attendance: float = Form(75.0),
+    user: Dict[str, Any] = Depends(require_user),
+    conn: sqlite3.Connection = Depends(db),
 ):
-    user = require_user(request)
-    conn = get_conn()
-    conn.execute(
-        """
-        INSERT INTO subjects (user_id, code, name, credits, target_attendance, created_at)
-        VALUES (?, ?, ?, ?, ?, ?)
-        """,
-        (user["id"], code.strip(), name.strip(), int(credits), float(target_attendance), now_iso()),
-    )
-    conn.commit()
-    conn.close()
+    with conn:
+        conn.execute(
+            """
+            INSERT INTO subjects (user_id, code, name, credits, target_attendance, created_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            (user["id"], code.strip(), name.strip(), int(credits), float(target_attendance), now_iso()),
+        )
+        bump_attendance_version(conn, user["id"])
     return RedirectResponse(url="/subjects", status_code=303)
 
 @app.post("/subjects/delete")
-def subjects_delete(request: Request, subject_id: int = Form(...)):
-    user = require_user(request)
-    conn = get_conn()
-    conn.execute("DELETE FROM subjects WHERE id = ? AND user_id = ?", (int(subject_id), user["id"]))
-    conn.commit()
-    conn.close()
+def subjects_delete(request: Request, subject_id: int = Form(...), user: Dict[str, Any] = Depends(require_user), conn: sqlite3.Connection = Depends(db)):
+    with conn:
+        conn.execute("DELETE FROM subjects WHERE id = ? AND user_id = ?", (int(subject_id), user["id"]))
+        bump_attendance_version(conn, user["id"])
     return RedirectResponse(url="/subjects", status_code=303)
 
 # ---------- Timetable ----------
 
 @app.get("/timetable", response_class=HTMLResponse)
-def timetable_page(request: Request, day: Optional[int] = None):
-    redir = redirect_if_not_logged_in(request)
-    if redir:
-        return redir
-    user = require_user(request)
+def timetable_page(request: Request, day: Optional[int] = None, user: Dict[str, Any] = Depends(page_user), conn: sqlite3.Connection = Depends(page_db)):
     day = _weekday_idx(date.today()) if day is None else int(day)
 
-    conn = get_conn()
-    subjects = conn.execute("SELECT id, name, code FROM subjects WHERE user_id = ? ORDER BY name", (user["id"],)).fetchall()
-    entries = conn.execute(
-        """
-        SELECT t.*, s.name AS subject_name, s.code AS subject_code
-        FROM timetable_entries t
-        JOIN subjects s ON s.id = t.subject_id
-        WHERE t.user_id = ? AND t.day_of_week = ?
-        ORDER BY t.start_time
-        """,
-        (user["id"], day),
-    ).fetchall()
-    conn.close()
+    subjects = conn.execute(SQL_SUBJECT_OPTIONS, (user["id"],)).fetchall()
+    entries = conn.execute(SQL_DAY_ENTRIES, (user["id"], day)).fetchall()
 
-    days = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
     return templates.TemplateResponse(
         "timetable.html",
         {
             "request": request,
             "user": user,
             "day": day,
-            "day_label": days[day],
-            "days": list(enumerate(days)),
+            "day_label": DAY_LABELS[day],
+            "days": DAY_CHOICES,
             "subjects": subjects,
             "entries": entries,
         },
@@ -442,104 +703,46 @@ def timetable_add(
     start_time: str = Form(...),
     end_time: str = Form(...),
     location: str = Form(""),
+    user: Dict[str, Any] = Depends(require_user),
+    conn: sqlite3.Connection = Depends(db),
 ):
-    user = require_user(request)
-    conn = get_conn()
-    conn.execute(
-        """
-        INSERT INTO timetable_entries
-        (user_id, subject_id, day_of_week, start_time, end_time, location, created_at)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-        """,
-        (user["id"], int(subject_id), int(day_of_week), start_time.strip(), end_time.strip(), location.strip(), now_iso()),
-    )
-    conn.commit()
-    conn.close()
+    with conn:
+        conn.execute(
+            """
+            INSERT INTO timetable_entries
+            (user_id, subject_id, day_of_week, start_time, end_time, location, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            """,
+            (user["id"], int(subject_id), int(day_of_week), start_time.strip(), end_time.strip(), location.strip(), now_iso()),
+        )
     return RedirectResponse(url=f"/timetable?day={int(day_of_week)}", status_code=303)
 
 @app.post("/timetable/delete")
-def timetable_delete(request: Request, entry_id: int = Form(...), day: int = Form(...)):
-    user = require_user(request)
-    conn = get_conn()
-    conn.execute("DELETE FROM timetable_entries WHERE id = ? AND user_id = ?", (int(entry_id), user["id"]))
-    conn.commit()
-    conn.close()
+def timetable_delete(request: Request, entry_id: int = Form(...), day: int = Form(...), user: Dict[str, Any] = Depends(require_user), conn: sqlite3.Connection = Depends(db)):
+    with conn:
+        conn.execute("DELETE FROM timetable_entries WHERE id = ? AND user_id = ?", (int(entry_id), user["id"]))
     return RedirectResponse(url=f"/timetable?day={int(day)}", status_code=303)
 
 # ---------- Attendance ----------
 
 @app.get("/attendance", response_class=HTMLResponse)
-def attendance_page(request: Request):
-    redir = redirect_if_not_logged_in(request)
-    if redir:
-        return redir
-    user = require_user(request)
-    conn = get_conn()
-    subjects = conn.execute("SELECT id, name, code, target_attendance FROM subjects WHERE user_id = ? ORDER BY name", (user["id"],)).fetchall()
-    # Recent records
-    recent = conn.execute(
-        """
-        SELECT a.*, s.name AS subject_name, s.code AS subject_code
-        FROM attendance_records a
-        JOIN subjects s ON s.id = a.subject_id
-        WHERE a.user_id = ?
-        ORDER BY a.class_date DESC
-        LIMIT 50
-        """,
-        (user["id"],),
-    ).fetchall()
-
-    summary = conn.execute(
-        """
-        SELECT
-            s.id AS subject_id,
-            COALESCE(s.code, '') AS subject_code,
-            s.name AS subject_name,
-            COUNT(a.id) AS total_classes,
-            SUM(CASE WHEN a.status='present' THEN 1 ELSE 0 END) AS present_classes,
-            s.target_attendance AS target_attendance
-        FROM subjects s
-        LEFT JOIN attendance_records a
-            ON a.subject_id = s.id AND a.user_id = s.user_id
-        WHERE s.user_id = ?
-        GROUP BY s.id
-        ORDER BY s.name
-        """,
-        (user["id"],),
-    ).fetchall()
-
-    conn.close()
-
-    def pct(present: int, total: int) -> float:
-        return round((present / total) * 100.0, 1) if total else 0.0
-
-    summary_rows = []
-    for row in summary:
-        total = int(row["total_classes"])
-        pres = int(row["present_classes"] or 0)
-        target_pct = float(row["target_attendance"] or 75.0)
-        target = (target_pct / 100.0) if target_pct else 0.0
-
-        percentage = pct(pres, total)
-
-        safe_absences = 0
-        need_attend = 0
-        if total > 0 and 0.0 < target < 1.0:
-            safe_absences = max(0, int((pres / target) - total))
-            if percentage < target_pct:
-                need_attend = int(math.ceil((target * total - pres) / (1.0 - target)))
-
-        summary_rows.append({
-            "subject_id": row["subject_id"],
-            "subject_code": row["subject_code"],
-            "subject_name": row["subject_name"],
-            "present": pres,
-            "total": total,
-            "percentage": percentage,
-            "target": target_pct,
-            "safe_absences": safe_absences,
-            "need_attend": need_attend,
-        })
+def attendance_page(request: Request, user: Dict[str, Any] = Depends(page_user), conn: sqlite3.Connection = Depends(page_db)):
+    with read_snapshot(conn):
+        subjects = conn.execute(SQL_SUBJECT_OPTIONS, (user["id"],)).fetchall()
+        # Recent records
+        recent = conn.execute(
+            """
+            SELECT a.id, a.class_date, a.status, a.note, s.name AS subject_name, s.code AS subject_code
+            FROM attendance_records a
+            JOIN subjects s ON s.id = a.subject_id
+            WHERE a.user_id = ?
+            ORDER BY a.class_date DESC
+            LIMIT 50
+            """,
+            (user["id"],),
+        ).fetchall()
+
+        summary_rows = attendance_summary(conn, user["id"])
 
     return templates.TemplateResponse(
         "attendance.html",
@@ -553,73 +756,44 @@ def attendance_mark(
     class_date: str = Form(...),
     status: str = Form(...),
     note: str = Form(""),
+    user: Dict[str, Any] = Depends(require_user),
+    conn: sqlite3.Connection = Depends(db),
 ):
-    user = require_user(request)
     status = status.strip().lower()
     if status not in {"present", "absent"}:
         raise HTTPException(status_code=400, detail="Invalid status")
 
-    conn = get_conn()
     # Upsert: if same date+subject exists, replace
-    conn.execute(
-        """
-        INSERT INTO attendance_records (user_id, subject_id, class_date, status, note, created_at)
-        VALUES (?, ?, ?, ?, ?, ?)
-        ON CONFLICT(user_id, subject_id, class_date)
-        DO UPDATE SET status=excluded.status, note=excluded.note
-        """,
-        (user["id"], int(subject_id), class_date.strip(), status, note.strip(), now_iso()),
-    )
-    conn.commit()
-    conn.close()
+    with conn:
+        conn.execute(
+            """
+            INSERT INTO attendance_records (user_id, subject_id, class_date, status, note, created_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(user_id, subject_id, class_date)
+            DO UPDATE SET status=excluded.status, note=excluded.note
+            """,
+            (user["id"], int(subject_id), class_date.strip(), status, note.strip(), now_iso()),
+        )
+        bump_attendance_version(conn, user["id"])
     return RedirectResponse(url="/attendance", status_code=303)
 
 @app.post("/attendance/delete")
-def attendance_delete(request: Request, record_id: int = Form(...)):
-    user = require_user(request)
-    conn = get_conn()
-    conn.execute("DELETE FROM attendance_records WHERE id = ? AND user_id = ?", (int(record_id), user["id"]))
-    conn.commit()
-    conn.close()
+def attendance_delete(request: Request, record_id: int = Form(...), user: Dict[str, Any] = Depends(require_user), conn: sqlite3.Connection = Depends(db)):
+    with conn:
+        conn.execute("DELETE FROM attendance_records WHERE id = ? AND user_id = ?", (int(record_id), user["id"]))
+        bump_attendance_version(conn, user["id"])
     return RedirectResponse(url="/attendance", status_code=303)
 
 # ---------- Tasks ----------
 
 @app.get("/tasks", response_class=HTMLResponse)
-def tasks_page(request: Request, show: str = "todo"):
-    redir = redirect_if_not_logged_in(request)
-    if redir:
-        return redir
-    user = require_user(request)
-    show = show if show in {"todo", "done", "all"} else "todo"
+def tasks_page(request: Request, show: str = "todo", user: Dict[str, Any] = Depends(page_user), conn: sqlite3.Connection = Depends(page_db)):
+    show = show if show in SQL_TASKS_LIST else "todo"
 
-    conn = get_conn()
-    subjects = conn.execute("SELECT id, name, code FROM subjects WHERE user_id = ? ORDER BY name", (user["id"],)).fetchall()
-
-    where = ""
-    params: List[Any] = [user["id"]]
-    if show == "todo":
-        where = "AND status='todo'"
-    elif show == "done":
-        where = "AND status='done'"
-
-    tasks = conn.execute(
-        f"""
-        SELECT tasks.*, subjects.name AS subject_name, subjects.code AS subject_code
-        FROM tasks
-        LEFT JOIN subjects ON subjects.id = tasks.subject_id
-        WHERE tasks.user_id = ?
-        {where}
-        ORDER BY
-          CASE tasks.status WHEN 'todo' THEN 0 ELSE 1 END,
-          CASE tasks.priority WHEN 'high' THEN 0 WHEN 'medium' THEN 1 ELSE 2 END,
-          tasks.due_at IS NULL,
-          tasks.due_at DESC
-        """,
-        params,
-    ).fetchall()
+    subjects = conn.execute(SQL_SUBJECT_OPTIONS, (user["id"],)).fetchall()
+
+    tasks = conn.execute(SQL_TASKS_LIST[show], (user["id"],)).fetchall()
 
-    conn.close()
     return templates.TemplateResponse("tasks.html", {"request": request, "user": user, "tasks": tasks, "subjects": subjects, "show": show, "today": date.today().isoformat()})
 
 @app.post("/tasks/add")
@@ -629,70 +803,61 @@ def tasks_add(
     subject_id: Optional[int] = Form(None),
     due_at: str = Form(""),
     priority: str = Form("medium"),
+    user: Dict[str, Any] = Depends(require_user),
+    conn: sqlite3.Connection = Depends(db),
 ):
-    user = require_user(request)
     priority = priority.strip().lower()
     if priority not in {"low", "medium", "high"}:
         priority = "medium"
 
     due_at_val = due_at.strip() or None
 
-    conn = get_conn()
-    conn.execute(
-        """
-        INSERT INTO tasks (user_id, subject_id, title, due_at, priority, status, created_at)
-        VALUES (?, ?, ?, ?, ?, 'todo', ?)
-        """,
-        (user["id"], int(subject_id) if subject_id else None, title.strip(), due_at_val, priority, now_iso()),
-    )
-    conn.commit()
-    conn.close()
+    with conn:
+        conn.execute(
+            """
+            INSERT INTO tasks (user_id, subject_id, title, due_at, priority, status, created_at)
+            VALUES (?, ?, ?, ?, ?, 'todo', ?)
+            """,
+            (user["id"], int(subject_id) if subject_id else None, title.strip(), due_at_val, priority, now_iso()),
+        )
     return RedirectResponse(url="/tasks", status_code=303)
 
 @app.post("/tasks/toggle")
-def tasks_toggle(request: Request, task_id: int = Form(...), next_status: str = Form(...), show: str = Form("todo")):
-    user = require_user(request)
+def tasks_toggle(request: Request, task_id: int = Form(...), next_status: str = Form(...), show: str = Form("todo"), user: Dict[str, Any] = Depends(require_user), conn: sqlite3.Connection = Depends(db)):
     next_status = next_status.strip().lower()
     if next_status not in {"todo", "done"}:
         raise HTTPException(status_code=400, detail="Invalid status")
-    conn = get_conn()
-    conn.execute("UPDATE tasks SET status=? WHERE id=? AND user_id=?", (next_status, int(task_id), user["id"]))
-    conn.commit()
-    conn.close()
+    with conn:
+        conn.execute("UPDATE tasks SET status=? WHERE id=? AND user_id=?", (next_status, int(task_id), user["id"]))
     return RedirectResponse(url=f"/tasks?show={show}", status_code=303)
 
 @app.post("/tasks/delete")
-def tasks_delete(request: Request, task_id: int = Form(...), show: str = Form("todo")):
-    user = require_user(request)
-    conn = get_conn()
-    conn.execute("DELETE FROM tasks WHERE id = ? AND user_id = ?", (int(task_id), user["id"]))
-    conn.commit()
-    conn.close()
+def tasks_delete(request: Request, task_id: int = Form(...), show: str = Form("todo"), user: Dict[str, Any] = Depends(require_user), conn: sqlite3.Connection = Depends(db)):
+    with conn:
+        conn.execute("DELETE FROM tasks WHERE id = ? AND user_id = ?", (int(task_id), user["id"]))
     return RedirectResponse(url=f"/tasks?show={show}", status_code=303)
 
 # ---------- Resources ----------
 
 @app.get("/resources", response_class=HTMLResponse)
-def resources_page(request: Request):
-    redir = redirect_if_not_logged_in(request)
-    if redir:
-        return redir
-    user = require_user(request)
-    conn = get_conn()
-    subjects = conn.execute("SELECT id, name, code FROM subjects WHERE user_id = ? ORDER BY name", (user["id"],)).fetchall()
-    resources = conn.execute(
-        """
-        SELECT r.*, s.name AS subject_name, s.code AS subject_code
-        FROM resources r
-        LEFT JOIN subjects s ON s.id = r.subject_id
-        WHERE r.user_id = ?
-        ORDER BY r.created_at DESC
-        LIMIT 200
-        """,
-        (user["id"],),
-    ).fetchall()
-    conn.close()
-    return templates.TemplateResponse("resources.html", {"request": request, "user": user, "subjects": subjects, "resources": resources})
+def resources_page(
+    request: Request,
+    after: Optional[str] = None,
+    after_id: Optional[int] = None,
+    user: Dict[str, Any] = Depends(page_user),
+    conn: sqlite3.Connection = Depends(page_db),
+):
+    subjects = conn.execute(SQL_SUBJECT_OPTIONS, (user["id"],)).fetchall()
+    paged = after is not None and after_id is not None
+    if paged:
+        resources = conn.execute(SQL_RESOURCES_AFTER, (user["id"], after, int(after_id), PAGE_SIZE + 1)).fetchall()
+    else:
+        resources = conn.execute(SQL_RESOURCES_FIRST, (user["id"], PAGE_SIZE + 1)).fetchall()
+    resources, next_url = keyset_page(resources, "/resources", "created_at")
+    return templates.TemplateResponse(
+        "resources.html",
+        {"request": request, "user": user, "subjects": subjects, "resources": resources, "next_url": next_url, "paged": paged},
+    )
 
 @app.post("/resources/add")
 def resources_add(
@@ -701,44 +866,45 @@ def resources_add(
     url: str = Form(...),
     subject_id: Optional[int] = Form(None),
     tags: str = Form(""),
+    user: Dict[str, Any] = Depends(require_user),
+    conn: sqlite3.Connection = Depends(db),
 ):
-    user = require_user(request)
-    conn = get_conn()
-    conn.execute(
-        """
-        INSERT INTO resources (user_id, subject_id, title, url, tags, created_at)
-        VALUES (?, ?, ?, ?, ?, ?)
-        """,
-        (user["id"], int(subject_id) if subject_id else None, title.strip(), url.strip(), tags.strip(), now_iso()),
-    )
-    conn.commit()
-    conn.close()
+    with conn:
+        conn.execute(
+            """
+            INSERT INTO resources (user_id, subject_id, title, url, tags, created_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            (user["id"], int(subject_id) if subject_id else None, title.strip(), url.strip(), tags.strip(), now_iso()),
+        )
     return RedirectResponse(url="/resources", status_code=303)
 
 @app.post("/resources/delete")
-def resources_delete(request: Request, resource_id: int = Form(...)):
-    user = require_user(request)
-    conn = get_conn()
-    conn.execute("DELETE FROM resources WHERE id=? AND user_id=?", (int(resource_id), user["id"]))
-    conn.commit()
-    conn.close()
+def resources_delete(request: Request, resource_id: int = Form(...), user: Dict[str, Any] = Depends(require_user), conn: sqlite3.Connection = Depends(db)):
+    with conn:
+        conn.execute("DELETE FROM resources WHERE id=? AND user_id=?", (int(resource_id), user["id"]))
     return RedirectResponse(url="/resources", status_code=303)
 
 # ---------- Coding logs ----------
 
 @app.get("/coding", response_class=HTMLResponse)
-def coding_page(request: Request):
-    redir = redirect_if_not_logged_in(request)
-    if redir:
-        return redir
-    user = require_user(request)
-    conn = get_conn()
-    logs = conn.execute(
-        "SELECT * FROM coding_logs WHERE user_id=? ORDER BY log_date DESC, created_at DESC LIMIT 200",
-        (user["id"],),
-    ).fetchall()
-    conn.close()
-    return templates.TemplateResponse("coding.html", {"request": request, "user": user, "logs": logs, "today": date.today().isoformat()})
+def coding_page(
+    request: Request,
+    after: Optional[str] = None,
+    after_id: Optional[int] = None,
+    user: Dict[str, Any] = Depends(page_user),
+    conn: sqlite3.Connection = Depends(page_db),
+):
+    paged = after is not None and after_id is not None
+    if paged:
+        logs = conn.execute(SQL_CODING_AFTER, (user["id"], after, int(after_id), PAGE_SIZE + 1)).fetchall()
+    else:
+        logs = conn.execute(SQL_CODING_FIRST, (user["id"], PAGE_SIZE + 1)).fetchall()
+    logs, next_url = keyset_page(logs, "/coding", "log_date")
+    return templates.TemplateResponse(
+        "coding.html",
+        {"request": request, "user": user, "logs": logs, "today": date.today().isoformat(), "next_url": next_url, "paged": paged},
+    )
 
 @app.post("/coding/add")
 def coding_add(
@@ -749,52 +915,55 @@ def coding_add(
     difficulty: str = Form(""),
     topic: str = Form(""),
     link: str = Form(""),
+    user: Dict[str, Any] = Depends(require_user),
+    conn: sqlite3.Connection = Depends(db),
 ):
-    user = require_user(request)
-    conn = get_conn()
-    conn.execute(
-        """
-        INSERT INTO coding_logs (user_id, log_date, platform, problem, difficulty, topic, link, created_at)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """,
-        (user["id"], log_date.strip(), platform.strip(), problem.strip(), difficulty.strip(), topic.strip(), link.strip(), now_iso()),
-    )
-    conn.commit()
-    conn.close()
+    with conn:
+        conn.execute(
+            """
+            INSERT INTO coding_logs (user_id, log_date, platform, problem, difficulty, topic, link, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (user["id"], log_date.strip(), platform.strip(), problem.strip(), difficulty.strip(), topic.strip(), link.strip(), now_iso()),
+        )
     return RedirectResponse(url="/coding", status_code=303)
 
 @app.post("/coding/delete")
-def coding_delete(request: Request, log_id: int = Form(...)):
-    user = require_user(request)
-    conn = get_conn()
-    conn.execute("DELETE FROM coding_logs WHERE id=? AND user_id=?", (int(log_id), user["id"]))
-    conn.commit()
-    conn.close()
+def coding_delete(request: Request, log_id: int = Form(...), user: Dict[str, Any] = Depends(require_user), conn: sqlite3.Connection = Depends(db)):
+    with conn:
+        conn.execute("DELETE FROM coding_logs WHERE id=? AND user_id=?", (int(log_id), user["id"]))
     return RedirectResponse(url="/coding", status_code=303)
 
 # ---------- JSON API (optional) ----------
 
-@app.get("/api/me")
-def api_me(request: Request):
-    user = require_user(request)
-    return {"id": user["id"], "name": user["name"], "email": user["email"]}
+# Rows are already plain dicts of str/int/float/None, so the handlers hand them
+# straight to orjson instead of going through jsonable_encoder + json.dumps.
 
-@app.get("/api/subjects")
-def api_subjects(request: Request):
-    user = require_user(request)
-    conn = get_conn()
-    rows = conn.execute("SELECT * FROM subjects WHERE user_id=? ORDER BY name", (user["id"],)).fetchall()
-    conn.close()
-    return [dict(r) for r in rows]
+@app.get("/api/me", response_class=ORJSONResponse)
+def api_me(user: Dict[str, Any] = Depends(require_user)):
+    return ORJSONResponse({"id": user["id"], "name": user["name"], "email": user["email"]})
 
-@app.get("/api/tasks")
-def api_tasks(request: Request, status: str = "todo"):
-    user = require_user(request)
+@app.get("/api/subjects", response_class=ORJSONResponse)
+def api_subjects(request: Request, user: Dict[str, Any] = Depends(require_user), conn: sqlite3.Connection = Depends(db)):
+    cur = dict_cursor(conn)
+    rows = cur.execute(
+        "SELECT id, user_id, code, name, credits, target_attendance FROM subjects WHERE user_id=? ORDER BY name",
+        (user["id"],),
+    ).fetchall()
+    return ORJSONResponse(rows)
+
+@app.get("/api/tasks", response_class=ORJSONResponse)
+def api_tasks(request: Request, status: str = "todo", user: Dict[str, Any] = Depends(require_user), conn: sqlite3.Connection = Depends(db)):
     status = status if status in {"todo", "done", "all"} else "todo"
-    conn = get_conn()
+    cur = dict_cursor(conn)
     if status == "all":
-        rows = conn.execute("SELECT * FROM tasks WHERE user_id=? ORDER BY created_at DESC", (user["id"],)).fetchall()
+        rows = cur.execute(
+            "SELECT id, user_id, subject_id, title, due_at, priority, status FROM tasks WHERE user_id=? ORDER BY created_at DESC",
+            (user["id"],),
+        ).fetchall()
     else:
-        rows = conn.execute("SELECT * FROM tasks WHERE user_id=? AND status=? ORDER BY created_at DESC", (user["id"], status)).fetchall()
-    conn.close()
-    return [dict(r) for r in rows]
+        rows = cur.execute(
+            "SELECT id, user_id, subject_id, title, due_at, priority, status FROM tasks WHERE user_id=? AND status=? ORDER BY created_at DESC",
+            (user["id"], status),
+        ).fetchall()
+    return ORJSONResponse(rows)